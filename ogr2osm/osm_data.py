@@ -9,13 +9,52 @@ Released under the MIT license, as given in the file LICENSE, which must
 accompany any distribution of this code.
 '''
 
+import array
+import codecs
 import logging
 from osgeo import ogr
 from osgeo import osr
 
 from .version import __program__
+from .translation_base_class import TranslationBase
 from .osm_geometries import OsmId, OsmBoundary, OsmNode, OsmWay, OsmRelation
 
+is_numpy_installed = False
+
+try:
+    import numpy
+
+    is_numpy_installed = True
+except ImportError:
+    pass
+
+# linestrings with less points are rounded without numpy, the overhead of
+# creating the arrays is larger than the gain for only a few points
+NUMPY_MIN_POINTS = 16
+
+POINT_TYPES = frozenset([ ogr.wkbPoint, ogr.wkbPoint25D ])
+MULTIPOINT_TYPES = frozenset([ ogr.wkbMultiPoint, ogr.wkbMultiPoint25D ])
+# ogr.wkbLinearRing25D does not exist
+LINESTRING_TYPES = frozenset([ ogr.wkbLineString, ogr.wkbLinearRing, ogr.wkbLineString25D ])
+MULTILINESTRING_TYPES = frozenset([ ogr.wkbMultiLineString, ogr.wkbMultiLineString25D ])
+POLYGON_TYPES = frozenset([ ogr.wkbPolygon, ogr.wkbPolygon25D ])
+MULTIPOLYGON_TYPES = frozenset([ ogr.wkbMultiPolygon, ogr.wkbMultiPolygon25D ])
+COLLECTION_TYPES = frozenset([ ogr.wkbGeometryCollection, ogr.wkbGeometryCollection25D ])
+# geometries within a collection are either parsed on their own or as relation members
+COLLECTION_GEOMETRY_TYPES = \
+    POINT_TYPES | MULTIPOINT_TYPES | LINESTRING_TYPES | MULTILINESTRING_TYPES
+COLLECTION_MEMBER_TYPES = POLYGON_TYPES | MULTIPOLYGON_TYPES
+
+# GDAL formats the values of these field types without any surrounding whitespace
+NUMERIC_FIELD_TYPES = frozenset([ ogr.OFTInteger, ogr.OFTInteger64, ogr.OFTReal ])
+
+# amount of feature envelopes collected before they are added to the bounds
+ENVELOPE_BUFFER_SIZE = 4096
+
+# shared by all untagged way nodes and polygon rings, never modify it nor pass
+# it on to the translation
+EMPTY_TAGS = {}
+
 class OsmData:
     def __init__(self, translation, rounding_digits=7, max_points_in_way=1800, add_bounds=False, \
                  start_id=0, is_positive=False):
@@ -23,16 +62,57 @@ class OsmData:
 
         # options
         self.translation = translation
+        # bound once, these are called for every feature, node or way
+        self.__filter_feature = translation.filter_feature
+        self.__filter_tags = translation.filter_tags
+        self.__merge_tags = translation.merge_tags
+        self.__get_unique_node_identifier = translation.get_unique_node_identifier
+        self.__process_feature_post = translation.process_feature_post
+        self.__has_custom_node_identifier = \
+            getattr(self.__get_unique_node_identifier, '__func__', None) is not \
+                TranslationBase.get_unique_node_identifier
         self.rounding_digits = rounding_digits
         self.max_points_in_way = max_points_in_way
         self.add_bounds = add_bounds
 
+        self.__scale = 10**rounding_digits
+        # bound to the scale, so it is not recalculated for every coordinate
+        self.__round_number = lambda n, scale=self.__scale: int(round(n * scale))
+        # numpy rounds to int64, which overflows silently for too many rounding digits
+        self.__use_numpy = is_numpy_installed and 180 * self.__scale < 2**63
+        # rounded coordinates are packed in a single int to identify a node, the
+        # shift leaves enough room for longitudes and latitudes in degrees
+        self.__coordinate_shift = (180 * self.__scale).bit_length() + 1
+        self.__coordinate_offset = 1 << (self.__coordinate_shift - 1)
+
         self.__bounds = OsmBoundary()
+        # envelopes of the features not yet added to the bounds,
+        # stored as a flat sequence of minx, maxx, miny, maxy
+        self.__envelopes = array.array('d')
         self.__nodes = []
         self.__unique_node_index = {}
         self.__ways = []
         self.__relations = []
 
+        # geometry type -> (parse function, True if the function returns a list)
+        # OGR MultiPolygon maps easily to osm multipolygon, so special case it
+        # TODO: Does anything else need special casing?
+        self.__geometry_parsers = {}
+        for (geometry_types, parse_function, returns_list) in \
+                [ (POINT_TYPES, self.__parse_point, False), \
+                  (MULTIPOINT_TYPES, self.__parse_multi_point, True), \
+                  (LINESTRING_TYPES, self.__parse_linestring, False), \
+                  (MULTILINESTRING_TYPES, self.__parse_multi_linestring, True), \
+                  (POLYGON_TYPES, self.__parse_polygon, False), \
+                  (MULTIPOLYGON_TYPES, self.__parse_multi_polygon, False), \
+                  (COLLECTION_TYPES, self.__parse_collection, True) ]:
+            for geometry_type in geometry_types:
+                self.__geometry_parsers[geometry_type] = (parse_function, returns_list)
+
+        # (layer_fields, source_encoding, field extractors) of the last seen layer,
+        # a new list of layer_fields is recognized by its identity only
+        self.__field_extractors = (None, None, [])
+
         OsmId.set_id(start_id, is_positive)
 
 
@@ -58,63 +138,118 @@ class OsmData:
         return layer_fields
 
 
+    # Binds a function to each field which reads its value from a feature, so
+    # the field type and encoding do not need to be inspected for every feature
+    def __get_field_extractors(self, layer_fields, source_encoding):
+        is_utf8 = codecs.lookup(source_encoding).name == 'utf-8'
+        extractors = []
+        for (index, field_name, field_type) in layer_fields:
+            if field_type == ogr.OFTString and not is_utf8:
+                extractor = lambda f, i=index, enc=source_encoding: \
+                                f.GetFieldAsBinary(i).decode(enc).strip()
+            elif field_type in NUMERIC_FIELD_TYPES:
+                extractor = lambda f, i=index: f.GetFieldAsString(i)
+            else:
+                extractor = lambda f, i=index: f.GetFieldAsString(i).strip()
+            extractors.append((field_name, extractor))
+        return extractors
+
+
     # This function builds up a dictionary with the source data attributes
     # and passes them to the filter_tags function, returning the result.
     def __get_feature_tags(self, ogrfeature, layer_fields, source_encoding):
-        tags = {}
-        for (index, field_name, field_type) in layer_fields:
-            field_value = ''
-            if field_type == ogr.OFTString:
-                field_value = ogrfeature.GetFieldAsBinary(index).decode(source_encoding)
-            else:
-                field_value = ogrfeature.GetFieldAsString(index)
+        (cached_fields, cached_encoding, extractors) = self.__field_extractors
+        if layer_fields is not cached_fields or source_encoding != cached_encoding:
+            extractors = self.__get_field_extractors(layer_fields, source_encoding)
+            self.__field_extractors = (layer_fields, source_encoding, extractors)
 
-            tags[field_name] = field_value.strip()
+        tags = { field_name: extract(ogrfeature) for (field_name, extract) in extractors }
 
-        return self.translation.filter_tags(tags)
+        return self.__filter_tags(tags)
 
 
     def __calc_bounds(self, ogrgeometry):
-        (minx, maxx, miny, maxy) = ogrgeometry.GetEnvelope()
-        self.__bounds.add_envelope(minx, maxx, miny, maxy)
+        self.__envelopes.extend(ogrgeometry.GetEnvelope())
+        if len(self.__envelopes) >= 4 * ENVELOPE_BUFFER_SIZE:
+            self.__merge_envelopes()
+
+
+    def __merge_envelopes(self):
+        envelopes = self.__envelopes
+        if envelopes:
+            self.__bounds.add_envelope(min(envelopes[0::4]), max(envelopes[1::4]), \
+                                       min(envelopes[2::4]), max(envelopes[3::4]))
+            del envelopes[:]
 
 
-    def __round_number(self, n):
-        return int(round(n * 10**self.rounding_digits))
+    def __get_rounded_points(self, ogrgeometry):
+        points = ogrgeometry.GetPoints()
+        if not points:
+            return []
+
+        if self.__use_numpy and len(points) >= NUMPY_MIN_POINTS:
+            coords = numpy.array(points, dtype=numpy.float64)[:, :2]
+            rounded = numpy.rint(coords * self.__scale).astype(numpy.int64)
+            return zip(coords[:, 0].tolist(), coords[:, 1].tolist(), \
+                       rounded[:, 0].tolist(), rounded[:, 1].tolist())
+        else:
+            round_number = self.__round_number
+            return [ (p[0], p[1], round_number(p[0]), round_number(p[1])) for p in points ]
+
+
+    def __get_coordinate_key(self, rx, ry):
+        offset = self.__coordinate_offset
+        if -offset <= ry < offset:
+            return ((rx + offset) << self.__coordinate_shift) | (ry + offset)
+        else:
+            # out of range, the tuple can not be mistaken for a packed key
+            return (rx, ry)
 
 
     def __add_node(self, x, y, tags, is_way_member):
         rx = self.__round_number(x)
         ry = self.__round_number(y)
+        return self.__add_rounded_node(x, y, rx, ry, tags, is_way_member)
 
+
+    def __add_rounded_node(self, x, y, rx, ry, tags, is_way_member):
         # TODO deprecated
         unique_node_id = None
-        if is_way_member:
+        if not self.__has_custom_node_identifier:
+            unique_node_id = self.__get_coordinate_key(rx, ry)
+        elif is_way_member:
             unique_node_id = (rx, ry)
         else:
-            unique_node_id = self.translation.get_unique_node_identifier(rx, ry, tags)
+            unique_node_id = self.__get_unique_node_identifier(rx, ry, tags)
         # to be replaced by
-        #unique_node_id = (rx, ry)
+        #unique_node_id = self.__get_coordinate_key(rx, ry)
         # end deprecation
 
-        if unique_node_id in self.__unique_node_index:
-            for index in self.__unique_node_index[unique_node_id]:
-                duplicate_node = self.__nodes[index]
-                merged_tags = self.translation.merge_tags('node', duplicate_node.tags, tags)
-                if merged_tags is not None:
-                    duplicate_node.tags = merged_tags
-                    return duplicate_node
-
+        # the index holds a single node per identifier, only when the tags of
+        # duplicate nodes can not be merged the entry is turned into a list
+        duplicate = self.__unique_node_index.get(unique_node_id)
+        if duplicate is None:
             node = OsmNode(x, y, tags)
-            self.__unique_node_index[unique_node_id].append(len(self.__nodes))
-            self.__nodes.append(node)
-            return node
-        else:
-            node = OsmNode(x, y, tags)
-            self.__unique_node_index[unique_node_id] = [ len(self.__nodes) ]
+            self.__unique_node_index[unique_node_id] = node
             self.__nodes.append(node)
             return node
 
+        if tags is EMPTY_TAGS:
+            # merge_tags may modify the tags of the new node
+            tags = {}
+        duplicate_nodes = duplicate if type(duplicate) is list else [ duplicate ]
+        for duplicate_node in duplicate_nodes:
+            merged_tags = self.__merge_tags('node', duplicate_node.tags, tags)
+            if merged_tags is not None:
+                duplicate_node.tags = merged_tags
+                return duplicate_node
+
+        node = OsmNode(x, y, tags)
+        duplicate_nodes.append(node)
+        self.__unique_node_index[unique_node_id] = duplicate_nodes
+        self.__nodes.append(node)
+        return node
+
 
     def __add_way(self, tags):
         way = OsmWay(tags)
@@ -139,34 +274,39 @@ class OsmData:
         return nodes
 
 
-    def __get_ordered_nodes(self, nodes):
-        is_closed = len(nodes) > 2 and nodes[0].id == nodes[-1].id
-        if is_closed:
-            lowest_index = 0
-            lowest_node_id = nodes[0].id
-            for i in range(1, len(nodes)):
-                if nodes[i].id < lowest_node_id:
-                    lowest_node_id = nodes[i].id
-                    lowest_index = i
-
-            return nodes[lowest_index:-1] + nodes[:lowest_index+1]
+    def __get_duplicate_way_type(self, way, other_node_ids, other_signed_area):
+        # The signed area rejects most ways which are no duplicate and tells which
+        # direction to compare, the reversed direction is compared without copy
+        node_ids = way.get_ordered_node_ids()
+        if len(node_ids) != len(other_node_ids):
+            return None
+        elif way.get_signed_area() == other_signed_area and node_ids == other_node_ids:
+            return 'way'
+        elif way.get_signed_area() == -other_signed_area and \
+             all(i == j for (i, j) in zip(node_ids, reversed(other_node_ids))):
+            return 'reverse_way'
         else:
-            return nodes
+            return None
 
 
     def __verify_duplicate_ways(self, potential_duplicate_ways, nodes, tags):
         duplicate_ways = []
-        ordered_nodes = self.__get_ordered_nodes(nodes)
+        if potential_duplicate_ways and tags is EMPTY_TAGS:
+            # merge_tags may modify the tags of the new way
+            tags = {}
+        ordered_node_ids = None
+        signed_area = None
         for dupway in potential_duplicate_ways:
             if len(dupway.nodes) == len(nodes):
-                dupnodes = self.__get_ordered_nodes(dupway.nodes)
+                if ordered_node_ids is None:
+                    ordered_node_ids = OsmWay.order_node_ids(tuple(node.id for node in nodes))
+                    signed_area = OsmWay.calc_signed_area(nodes)
+                duplicate_type = \
+                    self.__get_duplicate_way_type(dupway, ordered_node_ids, signed_area)
                 merged_tags = None
-                if dupnodes == ordered_nodes:
-                    #duplicate_ways.append((dupway, 'way'))
-                    merged_tags = self.translation.merge_tags('way', dupway.tags, tags)
-                elif dupnodes == list(reversed(ordered_nodes)):
-                    #duplicate_ways.append((dupway, 'reverse_way'))
-                    merged_tags = self.translation.merge_tags('reverse_way', dupway.tags, tags)
+                if duplicate_type is not None:
+                    #duplicate_ways.append((dupway, duplicate_type))
+                    merged_tags = self.__merge_tags(duplicate_type, dupway.tags, tags)
                 if merged_tags is not None:
                     dupway.tags = merged_tags
                     return dupway
@@ -181,17 +321,22 @@ class OsmData:
     def __parse_linestring(self, ogrgeometry, tags):
         previous_node_id = None
         nodes = []
-        potential_duplicate_ways = []
-        for i in range(ogrgeometry.GetPointCount()):
-            (x, y, z_unused) = ogrgeometry.GetPoint(i)
-            node = self.__add_node(x, y, {}, True)
+        potential_duplicate_ways = set()
+        for (x, y, rx, ry) in self.__get_rounded_points(ogrgeometry):
+            node = self.__add_rounded_node(x, y, rx, ry, EMPTY_TAGS, True)
             if previous_node_id is None or previous_node_id != node.id:
                 if previous_node_id is None:
-                    # first node: add all parent ways as potential duplicates
-                    potential_duplicate_ways = [ p for p in node.get_parents() if type(p) == OsmWay ]
-                elif not any(node.get_parents()) and any(potential_duplicate_ways):
-                    # next nodes: if node doesn't belong to another way then this way is unique
-                    potential_duplicate_ways.clear()
+                    # first node: add all parent ways as potential duplicates, except for
+                    #             the ways having more nodes than this linestring has points
+                    parent_ways = node.get_parent_ways()
+                    if parent_ways:
+                        point_count = ogrgeometry.GetPointCount()
+                        potential_duplicate_ways = \
+                            { p for p in parent_ways if len(p.nodes) <= point_count }
+                elif potential_duplicate_ways:
+                    # next nodes: a duplicate way contains all nodes of this way, so only
+                    #             keep the ways to which this node belongs as well
+                    potential_duplicate_ways.intersection_update(node.get_parent_ways())
                 nodes.append(node)
                 previous_node_id = node.id
 
@@ -210,15 +355,15 @@ class OsmData:
         
         # exterior ring
         exterior_geom_type = ogrgeometry.GetGeometryRef(0).GetGeometryType()
-        if exterior_geom_type in [ ogr.wkbLineString, ogr.wkbLinearRing, ogr.wkbLineString25D ]:
-            exterior = self.__parse_linestring(ogrgeometry.GetGeometryRef(0), {})
+        if exterior_geom_type in LINESTRING_TYPES:
+            exterior = self.__parse_linestring(ogrgeometry.GetGeometryRef(0), EMPTY_TAGS)
             members.append((exterior, 'outer'))
             if first:
                 # first member: add all parent relations as potential duplicates
                 potential_duplicate_relations.extend(
-                    [ p for p in exterior.get_parents() \
-                        if type(p) == OsmRelation and p.get_member_role(exterior) == 'outer' ])
-            elif not any(exterior.get_parents()) and any(potential_duplicate_relations):
+                    [ p for p in exterior.get_parent_relations() \
+                        if p.get_member_role(exterior) == 'outer' ])
+            elif potential_duplicate_relations and not exterior.has_parents():
                 # next members: if interior doesn't belong to another relation then this
                 #               relation is unique
                 potential_duplicate_relations.clear()
@@ -228,9 +373,9 @@ class OsmData:
 
         # interior rings
         for i in range(1, ogrgeometry.GetGeometryCount()):
-            interior = self.__parse_linestring(ogrgeometry.GetGeometryRef(i), {})
+            interior = self.__parse_linestring(ogrgeometry.GetGeometryRef(i), EMPTY_TAGS)
             members.append((interior, "inner"))
-            if not any(interior.get_parents()) and any(potential_duplicate_relations):
+            if potential_duplicate_relations and not interior.has_parents():
                 # next members: if interior doesn't belong to another relation then this
                 #               relation is unique
                 potential_duplicate_relations.clear()
@@ -245,7 +390,7 @@ class OsmData:
         duplicate_relations = []
         for duprelation in potential_duplicate_relations:
             if duprelation.members == members:
-                merged_tags = self.translation.merge_tags('relation', duprelation.tags, tags)
+                merged_tags = self.__merge_tags('relation', duprelation.tags, tags)
                 if merged_tags is not None:
                     duprelation.tags = merged_tags
                     return duprelation
@@ -296,19 +441,16 @@ class OsmData:
             collection_geom = ogrgeometry.GetGeometryRef(geom)
             collection_geom_type = collection_geom.GetGeometryType()
 
-            if collection_geom_type in [ ogr.wkbPoint, ogr.wkbPoint25D, \
-                                         ogr.wkbMultiPoint, ogr.wkbMultiPoint25D, \
-                                         ogr.wkbLineString, ogr.wkbLinearRing, ogr.wkbLineString25D, \
-                                         ogr.wkbMultiLineString, ogr.wkbMultiLineString25D ]:
+            if collection_geom_type in COLLECTION_GEOMETRY_TYPES:
                 osmgeometries.extend(self.__parse_geometry(collection_geom, tags))
-            elif collection_geom_type in [ ogr.wkbPolygon, ogr.wkbPolygon25D, \
-                                           ogr.wkbMultiPolygon, ogr.wkbMultiPolygon25D ]:
+            elif collection_geom_type in COLLECTION_MEMBER_TYPES:
                 members.extend(self.__parse_polygon_members(collection_geom, \
                                                             potential_duplicate_relations, \
-                                                            not any(members)))
+                                                            not members))
             else:
                 # no support for nested collections or other unsupported types
-                self.logger.warning("Unhandled geometry in collection, type %d", geometry_type)
+                self.logger.warning("Unhandled geometry in collection, type %d", \
+                                    collection_geom_type)
 
         if len(members) == 1 and len(members[0].nodes) <= self.max_points_in_way:
             # only 1 polygon with 1 outer ring
@@ -321,36 +463,35 @@ class OsmData:
         return osmgeometries
 
 
-    def __parse_geometry(self, ogrgeometry, tags):
-        osmgeometries = []
-
+    # When ogrfeature is given, process_feature_post is called for each geometry
+    # returned for the feature, as soon as it is parsed. For a collection that is
+    # every geometry it returns, the rings of a polygon don't get a call.
+    def __parse_geometry(self, ogrgeometry, tags, ogrfeature=None):
         geometry_type = ogrgeometry.GetGeometryType()
 
-        if geometry_type in [ ogr.wkbPoint, ogr.wkbPoint25D ]:
-            osmgeometries.append(self.__parse_point(ogrgeometry, tags))
-        elif geometry_type in [ ogr.wkbMultiPoint, ogr.wkbMultiPoint25D ]:
-            osmgeometries.extend(self.__parse_multi_point(ogrgeometry, tags))
-        elif geometry_type in [ ogr.wkbLineString, ogr.wkbLinearRing, ogr.wkbLineString25D ]:
-            # ogr.wkbLinearRing25D does not exist
-            osmgeometries.append(self.__parse_linestring(ogrgeometry, tags))
-        elif geometry_type in [ ogr.wkbMultiLineString, ogr.wkbMultiLineString25D ]:
-            osmgeometries.extend(self.__parse_multi_linestring(ogrgeometry, tags))
-        elif geometry_type in [ ogr.wkbPolygon, ogr.wkbPolygon25D ]:
-            osmgeometries.append(self.__parse_polygon(ogrgeometry, tags))
-        elif geometry_type in [ ogr.wkbMultiPolygon, ogr.wkbMultiPolygon25D ]:
-            # OGR MultiPolygon maps easily to osm multipolygon, so special case it
-            # TODO: Does anything else need special casing?
-            osmgeometries.append(self.__parse_multi_polygon(ogrgeometry, tags))
-        elif geometry_type in [ ogr.wkbGeometryCollection, ogr.wkbGeometryCollection25D ]:
-            osmgeometries.append(self.__parse_collection(ogrgeometry, tags))
-        else:
+        (parse_function, returns_list) = self.__geometry_parsers.get(geometry_type, (None, False))
+        if parse_function is None:
             self.logger.warning("Unhandled geometry, type %d", geometry_type)
-
-        return osmgeometries
+            return []
+        elif returns_list:
+            osmgeometries = parse_function(ogrgeometry, tags)
+            if ogrfeature is not None:
+                for osmgeometry in osmgeometries:
+                    if osmgeometry:
+                        self.__process_feature_post(osmgeometry, ogrfeature, ogrgeometry)
+            return osmgeometries
+        else:
+            osmgeometry = parse_function(ogrgeometry, tags)
+            if ogrfeature is not None and osmgeometry:
+                self.__process_feature_post(osmgeometry, ogrfeature, ogrgeometry)
+            return [ osmgeometry ]
 
 
+    # layer_fields is a list of tuples (index, field_name, field_type). The way each
+    # field is read is cached for the layer_fields object that is passed, so pass a
+    # new list for each layer instead of modifying the list of the previous layer.
     def add_feature(self, ogrfeature, layer_fields, source_encoding, reproject = lambda geometry: None):
-        ogrfilteredfeature = self.translation.filter_feature(ogrfeature, layer_fields, reproject)
+        ogrfilteredfeature = self.__filter_feature(ogrfeature, layer_fields, reproject)
         if ogrfilteredfeature is None:
             return
 
@@ -367,16 +508,14 @@ class OsmData:
         if self.add_bounds:
             self.__calc_bounds(ogrgeometry)
 
-        osmgeometries = self.__parse_geometry(ogrgeometry, feature_tags)
-
-        # TODO performance: run in __parse_geometry to avoid second loop
-        for osmgeometry in [ geom for geom in osmgeometries if geom ]:
-            self.translation.process_feature_post(osmgeometry, ogrfilteredfeature, ogrgeometry)
+        self.__parse_geometry(ogrgeometry, feature_tags, ogrfilteredfeature)
 
 
     def __split_way(self, way):
-        new_nodes = [ way.nodes[i:i + self.max_points_in_way] \
-                               for i in range(0, len(way.nodes), self.max_points_in_way - 1) ]
+        way_nodes = way.nodes
+        max_points_in_way = self.max_points_in_way
+        new_nodes = [ way_nodes[i:i + max_points_in_way] \
+                               for i in range(0, len(way_nodes), max_points_in_way - 1) ]
         new_ways = [ way ] + [ OsmWay(way.tags) for i in range(len(new_nodes) - 1) ]
 
         for new_way, nodes in zip(new_ways, new_nodes):
@@ -384,8 +523,7 @@ class OsmData:
             if new_way.id != way.id:
                 self.__ways.append(new_way)
                 for node in nodes:
-                    node.removeparent(way)
-                    node.addparent(new_way)
+                    node.replaceparent(way, new_way)
 
         return new_ways
 
@@ -407,7 +545,7 @@ class OsmData:
         for way in self.__ways:
             if len(way.nodes) > self.max_points_in_way:
                 way_parts = self.__split_way(way)
-                for rel in way.get_parents():
+                for rel in way.get_parent_relations():
                     self.__split_way_in_relation(rel, way_parts)
 
 
@@ -417,9 +555,13 @@ class OsmData:
 
             if layer:
                 layer_fields = self.__get_layer_fields(layer)
-                for j in range(layer.GetFeatureCount()):
-                    ogrfeature = layer.GetNextFeature()
+                # GetFeatureCount may have to read the whole layer for some drivers,
+                # so read until there are no features left instead
+                layer.ResetReading()
+                ogrfeature = layer.GetNextFeature()
+                while ogrfeature is not None:
                     self.add_feature(ogrfeature, layer_fields, datasource.source_encoding, reproject)
+                    ogrfeature = layer.GetNextFeature()
 
         self.split_long_ways()
 
@@ -439,6 +581,8 @@ class OsmData:
     def output(self, datawriter):
         self.translation.process_output(self.__nodes, self.__ways, self.__relations)
 
+        self.__merge_envelopes()
+
         with self.DataWriterContextManager(datawriter) as dw:
             dw.write_header(self.__bounds)
             dw.write_nodes(self.__nodes)
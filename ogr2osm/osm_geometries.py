@@ -10,6 +10,7 @@ accompany any distribution of this code.
 '''
 
 import logging
+import math
 from lxml import etree
 
 from .version import __program__
@@ -79,10 +80,17 @@ class OsmBoundary:
 
 
 class OsmGeometry:
+    __slots__ = ('id', 'tags', '__parent_ways', '__parent_relations')
+
+    # shared by all geometries without parents of a given type, a set is only
+    # created when the first parent is added
+    NO_PARENTS = frozenset()
+
     def __init__(self):
         self.id = self.__get_new_id()
         self.tags = {}
-        self.__parents = set()
+        self.__parent_ways = OsmGeometry.NO_PARENTS
+        self.__parent_relations = OsmGeometry.NO_PARENTS
 
 
     def __get_new_id(self):
@@ -91,15 +99,60 @@ class OsmGeometry:
 
 
     def addparent(self, parent):
-        self.__parents.add(parent)
+        if isinstance(parent, OsmWay):
+            if self.__parent_ways is OsmGeometry.NO_PARENTS:
+                self.__parent_ways = set()
+            self.__parent_ways.add(parent)
+        else:
+            if self.__parent_relations is OsmGeometry.NO_PARENTS:
+                self.__parent_relations = set()
+            self.__parent_relations.add(parent)
 
 
     def removeparent(self, parent):
-        self.__parents.discard(parent)
+        if isinstance(parent, OsmWay):
+            if self.__parent_ways:
+                self.__parent_ways.discard(parent)
+        elif self.__parent_relations:
+            self.__parent_relations.discard(parent)
+
+
+    def replaceparent(self, old_parent, new_parent):
+        # both parents must be of the same type, either ways or relations
+        # (the exact type test is cheaper and covers the ways created by ogr2osm)
+        if type(new_parent) is OsmWay or isinstance(new_parent, OsmWay):
+            parents = self.__parent_ways
+        else:
+            parents = self.__parent_relations
+
+        if parents:
+            parents.discard(old_parent)
+            parents.add(new_parent)
+        else:
+            self.addparent(new_parent)
 
 
     def get_parents(self):
-        return self.__parents
+        # The returned set must not be modified. It is only built when there are
+        # parents of both types, which does not happen for nodes and ways.
+        if not self.__parent_relations:
+            return self.__parent_ways
+        elif not self.__parent_ways:
+            return self.__parent_relations
+        else:
+            return self.__parent_ways | self.__parent_relations
+
+
+    def get_parent_ways(self):
+        return self.__parent_ways
+
+
+    def get_parent_relations(self):
+        return self.__parent_relations
+
+
+    def has_parents(self):
+        return len(self.__parent_ways) > 0 or len(self.__parent_relations) > 0
 
 
     def _add_tags_to_xml(self, xmlobject, suppress_empty_tags, max_tag_length, tag_overflow):
@@ -119,6 +172,12 @@ class OsmGeometry:
 
 
 class OsmNode(OsmGeometry):
+    # nodes are by far the most numerous objects, so don't give them a __dict__
+    # x and y keep the full precision of the source coordinates, they can't be
+    # derived from the rounded coordinates used for merging nodes since the
+    # output may have more significant digits than the rounding digits
+    __slots__ = ('x', 'y')
+
     def __init__(self, x, y, tags):
         super().__init__()
         self.x = x
@@ -145,10 +204,68 @@ class OsmNode(OsmGeometry):
 class OsmWay(OsmGeometry):
     def __init__(self, tags):
         super().__init__()
-        self.nodes = []
+        self.__nodes = []
+        self.__node_ids = None
+        self.__ordered_node_ids = None
+        self.__signed_area = None
         self.tags.update({ k: (v if type(v) == list else [ v ]) for (k, v) in tags.items() })
 
 
+    @property
+    def nodes(self):
+        return self.__nodes
+
+
+    @nodes.setter
+    def nodes(self, nodes):
+        self.__nodes = nodes
+        self.__node_ids = None
+        self.__ordered_node_ids = None
+        self.__signed_area = None
+
+
+    @staticmethod
+    def order_node_ids(node_ids):
+        # closed ways start and end at their lowest node id, so ways consisting
+        # of the same nodes have the same node ids when ordered
+        is_closed = len(node_ids) > 2 and node_ids[0] == node_ids[-1]
+        if is_closed:
+            lowest_index = node_ids.index(min(node_ids))
+            return node_ids[lowest_index:-1] + node_ids[:lowest_index+1]
+        else:
+            return node_ids
+
+
+    @staticmethod
+    def calc_signed_area(nodes):
+        # Twice the signed area enclosed by the nodes, the way is closed implicitly.
+        # Every term changes sign when the nodes are reversed and fsum does not
+        # depend on the order of the terms, so a reversed way has exactly the
+        # negated area and a rotated ring exactly the same area.
+        return math.fsum(a.x * b.y - b.x * a.y for (a, b) in zip(nodes, nodes[1:] + nodes[:1]))
+
+
+    def get_node_ids(self):
+        # cached, only valid as long as the node list is not modified in place
+        if self.__node_ids is None:
+            self.__node_ids = tuple(node.id for node in self.__nodes)
+        return self.__node_ids
+
+
+    def get_ordered_node_ids(self):
+        # cached, only valid as long as the node list is not modified in place
+        if self.__ordered_node_ids is None:
+            self.__ordered_node_ids = OsmWay.order_node_ids(self.get_node_ids())
+        return self.__ordered_node_ids
+
+
+    def get_signed_area(self):
+        # cached, only valid as long as the node list is not modified in place
+        if self.__signed_area is None:
+            self.__signed_area = OsmWay.calc_signed_area(self.__nodes)
+        return self.__signed_area
+
+
     def to_xml(self, attributes, significant_digits, \
                      suppress_empty_tags, max_tag_length, tag_overflow):
         xmlattrs = { 'visible':'true', 'id':('%d' % self.id) }
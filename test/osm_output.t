@@ -167,6 +167,38 @@ collectionduplicate:
   Writing file footer
   $ xmllint --format collection_duplicate.osm | diff -uNr - $TESTDIR/collection.xml
 
+collectionpost:
+  $ ogr2osm -t $TESTDIR/translations/post-translation.py -f $TESTDIR/shapefiles/collection.kml
+  Found valid translation class PostTranslation
+  Preparing to convert .* (re)
+  Detected projection metadata:
+  GEOGCS["WGS 84",
+      DATUM["WGS_1984",
+          SPHEROID["WGS 84",6378137,298.257223563,
+              AUTHORITY["EPSG","7030"]],
+          AUTHORITY["EPSG","6326"]],
+      PRIMEM["Greenwich",0,
+          AUTHORITY["EPSG","8901"]],
+      UNIT["degree",0.0174532925199433,
+          AUTHORITY["EPSG","9122"]],
+      AXIS["Latitude",NORTH],
+      AXIS["Longitude",EAST],
+      AUTHORITY["EPSG","4326"]]
+  Processed OsmNode -1
+  Processed OsmNode -2
+  Processed OsmNode -3
+  Processed OsmWay -14
+  Processed OsmWay -32
+  Processed OsmWay -55
+  Processed OsmRelation -179
+  Splitting long ways
+  Writing file header
+  Writing nodes
+  Writing ways
+  Writing relations
+  Writing file footer
+  $ xmllint --format collection.osm | diff -uNr - $TESTDIR/collection.xml
+
 mergetags:
   $ ogr2osm -f $TESTDIR/shapefiles/mergetags.geojson
   Using default translations
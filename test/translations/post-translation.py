@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+
+'''
+Copyright (c) 2012-2021 Roel Derickx, Paul Norman <penorman@mac.com>,
+Sebastiaan Couwenberg <sebastic@xs4all.nl>, The University of Vermont
+<andrew.guertin@uvm.edu>, github contributors
+
+Released under the MIT license, as given in the file LICENSE, which must
+accompany any distribution of this code.
+'''
+
+import ogr2osm, logging
+
+class PostTranslation(ogr2osm.TranslationBase):
+    def __init__(self):
+        self.logger = logging.getLogger('ogr2osm')
+
+
+    def process_feature_post(self, osmgeometry, ogrfeature, ogrgeometry):
+        self.logger.debug('Processed %s %d' % (type(osmgeometry).__name__, osmgeometry.id))